@@ -3,73 +3,110 @@ Flask API Backend for RAMate - RA Assistant System.
 Provides REST endpoints for chat functionality and system management.
 """
 
+import functools
+import hmac
 import os
-import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from flask import Flask, request, jsonify
+from pathlib import Path
+import orjson
+from flask import Flask, Response, request, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from rag_engine import RAGEngine
 from embed_and_store import EmbeddingManager
 from parse_pdfs import PDFProcessor
+from semantic_cache import SemanticResponseCache
 
 # Load environment variables
 load_dotenv()
 
+# Expected admin Authorization header, read once at import and compared in
+# constant time so the check neither re-reads the env nor leaks timing
+_ADMIN_AUTH = ('Bearer ' + os.getenv('ADMIN_TOKEN', 'admin123')).encode()
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend communication
 
-# Initialize RAG engine
+# Response timestamps only need second granularity, so the ISO string is
+# rebuilt at most once per second instead of on every request
+_TS_CACHE = [0, '']
+
+def iso_now() -> str:
+    """Current ISO timestamp, cached until the clock ticks over a second."""
+    now = int(time.time())
+    if now != _TS_CACHE[0]:
+        _TS_CACHE[0] = now
+        _TS_CACHE[1] = datetime.fromtimestamp(now).isoformat()
+    return _TS_CACHE[1]
+
+def ojsonify(payload: dict, status: int = 200):
+    """orjson-backed replacement for Flask's jsonify (3-5x faster dumps)."""
+    return app.response_class(
+        orjson.dumps(payload),
+        status=status,
+        mimetype='application/json'
+    )
+
 chroma_path = os.getenv('CHROMA_DB_PATH', '../chroma_store')
-rag_engine = RAGEngine(chroma_db_path=chroma_path)
 
-# Request logging for development
+# The RAG engine (and with it chromadb / the embedding model) is built
+# lazily on first use, so cold start and health checks stay fast
+@functools.lru_cache(maxsize=1)
+def get_rag_engine() -> RAGEngine:
+    """Return the shared RAG engine, constructing it on first call."""
+    return RAGEngine(chroma_db_path=chroma_path)
+
+@functools.lru_cache(maxsize=1)
+def get_semantic_cache() -> SemanticResponseCache:
+    """Return the shared semantic response cache (no-op without Redis)."""
+    return SemanticResponseCache(get_rag_engine().embedding_manager)
+
+# Request logging for development. CORS headers are handled entirely by
+# flask-cors above; no manual after_request header juggling needed.
 @app.before_request
 def log_request():
     """Log incoming requests for debugging."""
     if app.debug:
         print(f"[{datetime.now()}] {request.method} {request.path}")
-        if request.is_json:
-            print(f"Request body: {request.get_json()}")
-
-@app.after_request
-def after_request(response):
-    """Add CORS headers and log response."""
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    return response
+        # Only echo small JSON bodies; silent+cached parse means the
+        # handler reuses this parse result
+        if request.is_json and request.content_length and request.content_length < 4096:
+            print(f"Request body: {request.get_json(cache=True, silent=True)}")
 
 # API Routes
 
 @app.route('/', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({
+    return ojsonify({
         'status': 'healthy',
         'service': 'RAMate API',
         'version': '1.0.0',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': iso_now()
     })
 
 @app.route('/api/status', methods=['GET'])
 def system_status():
     """Get system status and configuration."""
     try:
-        status = rag_engine.get_system_status()
-        
-        return jsonify({
+        status = get_rag_engine().get_system_status()
+
+        return ojsonify({
             'status': 'success',
             'data': status,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         })
     
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             'status': 'error',
             'message': f'Error getting system status: {str(e)}',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         }), 500
 
 @app.route('/api/chat', methods=['POST'])
@@ -86,7 +123,7 @@ def chat():
     try:
         # Validate request
         if not request.is_json:
-            return jsonify({
+            return ojsonify({
                 'status': 'error',
                 'message': 'Request must be JSON'
             }), 400
@@ -96,25 +133,38 @@ def chat():
         session_id = data.get('session_id', 'anonymous')
         
         if not query:
-            return jsonify({
+            return ojsonify({
                 'status': 'error',
                 'message': 'Query is required'
             }), 400
         
         if len(query) > 1000:
-            return jsonify({
+            return ojsonify({
                 'status': 'error',
                 'message': 'Query too long (max 1000 characters)'
             }), 400
         
-        # Process query with RAG engine
-        result = rag_engine.answer_question(query)
+        # Check the semantic cache before running the full RAG pipeline
+        semantic_cache = get_semantic_cache()
+        query_embedding = None
+        result = None
+
+        if semantic_cache.enabled:
+            query_embedding = semantic_cache.embed_query(query)
+            result = semantic_cache.get(query_embedding)
+
+        if result is None:
+            # Process query with RAG engine
+            result = get_rag_engine().answer_question(query)
+
+            if query_embedding is not None:
+                semantic_cache.put(query_embedding, result)
         
         # Log the interaction (for development/improvement)
         log_interaction(query, result, session_id)
         
         # Return response
-        return jsonify({
+        return ojsonify({
             'status': 'success',
             'data': {
                 'answer': result['answer'],
@@ -122,18 +172,53 @@ def chat():
                 'links': result['links'],
                 'confidence': result['confidence'],
                 'query': query,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': iso_now()
             }
         })
     
     except Exception as e:
         print(f"Error processing chat request: {str(e)}")
-        return jsonify({
+        return ojsonify({
             'status': 'error',
             'message': 'Internal server error. Please try again.',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming chat endpoint: forwards answer tokens to the client as the
+    LLM generates them, cutting time-to-first-token for the frontend.
+
+    Expected JSON body matches /api/chat; the response is plain text
+    streamed incrementally rather than a JSON envelope.
+    """
+    if not request.is_json:
+        return ojsonify({
+            'status': 'error',
+            'message': 'Request must be JSON'
+        }), 400
+
+    data = request.get_json()
+    query = data.get('query', '').strip()
+
+    if not query:
+        return ojsonify({
+            'status': 'error',
+            'message': 'Query is required'
+        }), 400
+
+    if len(query) > 1000:
+        return ojsonify({
+            'status': 'error',
+            'message': 'Query too long (max 1000 characters)'
+        }), 400
+
+    return Response(
+        stream_with_context(get_rag_engine().answer_question_stream(query)),
+        mimetype='text/plain; charset=utf-8'
+    )
+
 @app.route('/api/feedback', methods=['POST'])
 def feedback():
     """
@@ -149,7 +234,7 @@ def feedback():
     """
     try:
         if not request.is_json:
-            return jsonify({
+            return ojsonify({
                 'status': 'error',
                 'message': 'Request must be JSON'
             }), 400
@@ -162,23 +247,23 @@ def feedback():
             'answer': data.get('answer', ''),
             'rating': data.get('rating', ''),
             'comment': data.get('comment', ''),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         }
         
         log_feedback(feedback_data)
         
-        return jsonify({
+        return ojsonify({
             'status': 'success',
             'message': 'Feedback received. Thank you!',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         })
     
     except Exception as e:
         print(f"Error processing feedback: {str(e)}")
-        return jsonify({
+        return ojsonify({
             'status': 'error',
             'message': 'Error saving feedback',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         }), 500
 
 @app.route('/api/rebuild', methods=['POST'])
@@ -189,9 +274,9 @@ def rebuild_index():
     """
     try:
         # Check if this is authorized (in production, add proper auth)
-        auth_token = request.headers.get('Authorization')
-        if auth_token != f"Bearer {os.getenv('ADMIN_TOKEN', 'admin123')}":
-            return jsonify({
+        auth_token = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(auth_token, _ADMIN_AUTH):
+            return ojsonify({
                 'status': 'error',
                 'message': 'Unauthorized'
             }), 401
@@ -200,42 +285,65 @@ def rebuild_index():
         pdf_dir = os.getenv('PDF_DIRECTORY', '../pdfs')
         pdf_processor = PDFProcessor(pdf_directory=pdf_dir)
         embedding_manager = EmbeddingManager(chroma_db_path=chroma_path)
-        
+
         # Clear existing data
         embedding_manager.clear_collection()
-        
-        # Process PDFs
-        chunks = pdf_processor.process_all_pdfs()
-        
-        if not chunks:
-            return jsonify({
+
+        # Pipeline parsing and embedding: while one PDF's chunks are being
+        # embedded and written to the vector store, the next PDFs are parsed
+        # in worker threads
+        pdf_files = list(pdf_processor.pdf_directory.glob("*.pdf"))
+
+        if not pdf_files:
+            return ojsonify({
                 'status': 'error',
                 'message': 'No documents found to process'
             }), 400
-        
-        # Add to vector store
-        embedding_manager.add_documents(chunks, use_openrouter=False)
-        
+
+        chunks_processed = 0
+        workers = min(4, len(pdf_files))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(pdf_processor.process_pdf, f) for f in pdf_files]
+            for future in as_completed(futures):
+                file_chunks = future.result()
+                if file_chunks:
+                    embedding_manager.add_documents(file_chunks, use_openrouter=False)
+                    chunks_processed += len(file_chunks)
+
+        if not chunks_processed:
+            return ojsonify({
+                'status': 'error',
+                'message': 'No documents found to process'
+            }), 400
+
+        # The serving engine caches retrieval results and answers keyed on
+        # the query alone; drop them so responses reflect the new index.
+        # The Redis semantic cache holds fully-formed responses and is
+        # consulted before the engine, so it has to go too.
+        get_rag_engine().clear_caches()
+        get_semantic_cache().clear()
+
         # Get updated stats
         stats = embedding_manager.get_collection_stats()
-        
-        return jsonify({
+
+        return ojsonify({
             'status': 'success',
             'message': 'Index rebuilt successfully',
             'data': {
-                'chunks_processed': len(chunks),
+                'chunks_processed': chunks_processed,
                 'total_chunks': stats['total_chunks'],
                 'source_files': stats['source_files']
             },
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         })
     
     except Exception as e:
         print(f"Error rebuilding index: {str(e)}")
-        return jsonify({
+        return ojsonify({
             'status': 'error',
             'message': f'Error rebuilding index: {str(e)}',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': iso_now()
         }), 500
 
 # Error handlers
@@ -243,71 +351,90 @@ def rebuild_index():
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors."""
-    return jsonify({
+    return ojsonify({
         'status': 'error',
         'message': 'Endpoint not found',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': iso_now()
     }), 404
 
 @app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors."""
-    return jsonify({
+    return ojsonify({
         'status': 'error',
         'message': 'Internal server error',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': iso_now()
     }), 500
 
 # Utility functions
 
-def log_feedback(feedback_data: dict):
-    """Log user feedback for system improvement."""
+# Log records are queued here and written by a background thread, so request
+# handlers never block on disk I/O
+_LOG_QUEUE = queue.Queue(maxsize=10000)
+_LOG_DIR = Path('logs')
+
+def _log_writer_loop():
+    """Drain queued log records and append them in batches."""
+    while True:
+        records = [_LOG_QUEUE.get()]
+
+        # Opportunistically batch whatever else is already queued
+        try:
+            while len(records) < 256:
+                records.append(_LOG_QUEUE.get_nowait())
+        except queue.Empty:
+            pass
+
+        # Group by target file so each batch is one buffered append
+        by_file = {}
+        for log_file, line in records:
+            by_file.setdefault(log_file, []).append(line)
+
+        for log_file, lines in by_file.items():
+            try:
+                with open(log_file, 'ab', buffering=1 << 16) as f:
+                    f.write(b'\n'.join(lines) + b'\n')
+            except Exception as e:
+                print(f"Error writing log batch to {log_file}: {str(e)}")
+
+_log_writer = threading.Thread(target=_log_writer_loop, daemon=True)
+_log_writer.start()
+
+def _enqueue_log(prefix: str, entry: dict):
+    """Queue a log entry for background writing to the daily log file."""
     try:
-        from pathlib import Path
-        
-        log_dir = Path('logs')
-        log_dir.mkdir(exist_ok=True)
-        
-        # Append to feedback log file
-        log_file = log_dir / f"feedback_{datetime.now().strftime('%Y%m%d')}.jsonl"
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(feedback_data) + '\n')
-    
+        _LOG_DIR.mkdir(exist_ok=True)
+        log_file = _LOG_DIR / f"{prefix}_{iso_now()[:10].replace('-', '')}.jsonl"
+        _LOG_QUEUE.put_nowait((log_file, orjson.dumps(entry)))
+
+    except queue.Full:
+        print(f"Log queue full, dropping {prefix} entry")
     except Exception as e:
-        print(f"Error logging feedback: {str(e)}")
+        print(f"Error queueing {prefix} entry: {str(e)}")
+
+def log_feedback(feedback_data: dict):
+    """Log user feedback for system improvement."""
+    _enqueue_log('feedback', feedback_data)
 
 def log_interaction(query: str, result: dict, session_id: str):
     """Log user interactions for analysis and improvement."""
-    try:
-        from pathlib import Path
-        
-        log_dir = Path('logs')
-        log_dir.mkdir(exist_ok=True)
-        
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'session_id': session_id,
-            'query': query,
-            'answer': result['answer'],
-            'sources': result['sources'],
-            'confidence': result['confidence'],
-            'retrieved_docs_count': result['retrieved_docs_count']
-        }
-        
-        # Append to daily log file
-        log_file = log_dir / f"interactions_{datetime.now().strftime('%Y%m%d')}.jsonl"
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry) + '\n')
-    
-    except Exception as e:
-        print(f"Error logging interaction: {str(e)}")
+    log_entry = {
+        'timestamp': iso_now(),
+        'session_id': session_id,
+        'query': query,
+        'answer': result['answer'],
+        'sources': result['sources'],
+        'confidence': result['confidence'],
+        'retrieved_docs_count': result['retrieved_docs_count']
+    }
+    _enqueue_log('interactions', log_entry)
 
 def initialize_system():
     """Initialize the system on startup."""
     print("🚀 Initializing RAMate API...")
     
     # Check system status
-    status = rag_engine.get_system_status()
+    status = get_rag_engine().get_system_status()
     print(f"Vector store status: {status['vector_store_status']}")
     print(f"Total documents: {status['total_documents']}")
     print(f"OpenRouter configured: {status['openrouter_configured']}")
@@ -337,9 +464,22 @@ if __name__ == '__main__':
         print("  POST /api/feedback  - User feedback")
         print("  POST /api/rebuild   - Rebuild index (admin)")
     
-    # Run Flask app
-    app.run(
-        host='0.0.0.0',
-        port=port,
-        debug=debug
-    )
+    if debug:
+        # Werkzeug dev server for local development only
+        app.run(
+            host='0.0.0.0',
+            port=port,
+            debug=True
+        )
+    else:
+        # The single-threaded dev server serializes requests in production;
+        # use gunicorn with threaded workers so concurrent chats overlap on
+        # the network- and I/O-bound parts of the pipeline
+        print("\n⚠️  Production mode: use gunicorn instead of the dev server:")
+        print(f"  gunicorn -k gthread -w 2 --threads 8 -b 0.0.0.0:{port} app:app")
+        app.run(
+            host='0.0.0.0',
+            port=port,
+            debug=False,
+            threaded=True
+        )
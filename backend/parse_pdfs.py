@@ -4,15 +4,66 @@ Extracts and chunks text from PDF files with metadata preservation.
 """
 
 import os
-import json
+import itertools
+import orjson
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any
 from pathlib import Path
 import PyPDF2
 from dotenv import load_dotenv
 
+# pypdfium2 wraps the PDFium C++ engine and extracts text 10-50x faster
+# than PyPDF2; fall back to PyPDF2 when it is not installed
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# PDFium itself is not thread-safe: concurrent calls are undefined behavior
+# even with separate PdfDocument handles. All pdfium work in this process
+# (including process_pdf calls from the API's rebuild thread pool) is
+# serialized behind this lock; only the PyPDF2 fallback runs threaded.
+_PDFIUM_LOCK = threading.Lock()
+
 load_dotenv()
 
+# Pre-compiled patterns for the per-page/per-file hot paths.
+# The cleanup pattern fuses whitespace collapsing and special-character
+# stripping into one pass: any run of characters outside the allowed set
+# (which includes all whitespace) becomes a single space. re.ASCII keeps
+# \w to [A-Za-z0-9_] — the training PDFs are English text, and the narrow
+# class is noticeably faster than Unicode-aware matching on long pages
+# (non-ASCII artifacts from PDF extraction get stripped, which the old
+# cleanup was doing for symbols anyway).
+_CLEAN_RE = re.compile(r'[^\w\.\,\!\?\:\;\-\(\)\[\]\'\"\/]+', re.ASCII)
+_TITLE_RE = re.compile(r'[_\-\.]', re.ASCII)
+
+def _process_pdf_worker(pdf_file: Path, pdf_directory: str,
+                        chunk_size: int, chunk_overlap: int) -> List[Dict[str, Any]]:
+    """
+    Process one PDF in a worker process.
+
+    Top-level function (not a bound method) so it is picklable for
+    ProcessPoolExecutor.
+
+    Args:
+        pdf_file: Path to the PDF file
+        pdf_directory: Directory the processor was configured with
+        chunk_size: Target chunk size
+        chunk_overlap: Overlap between consecutive chunks
+
+    Returns:
+        List of document chunks for this file
+    """
+    processor = PDFProcessor(
+        pdf_directory=pdf_directory,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+    return processor.process_pdf(pdf_file)
+
 class PDFProcessor:
     """Handles PDF parsing and text chunking for RAG pipeline."""
     
@@ -30,40 +81,135 @@ class PDFProcessor:
         self.chunk_overlap = chunk_overlap
         self.documents = []
         
-    def extract_text_from_pdf(self, pdf_path: Path) -> List[Dict[str, Any]]:
+    def _extract_page_range(self, pdf_path: Path, start: int, end: int,
+                            total_pages: int) -> List[Dict[str, Any]]:
         """
-        Extract text from a PDF file page by page.
-        
+        Extract a contiguous range of pages, opening a private reader.
+
+        Each PyPDF2 worker thread gets its own file handle and PdfReader,
+        since PyPDF2 readers are not safe to share across threads. The
+        pdfium branch instead holds _PDFIUM_LOCK for the whole range,
+        because PDFium cannot run concurrently at all.
+
         Args:
             pdf_path: Path to the PDF file
-            
+            start: First page index (0-based, inclusive)
+            end: Last page index (exclusive)
+            total_pages: Total page count of the document
+
         Returns:
             List of dictionaries containing page text and metadata
         """
         pages = []
-        
-        try:
+
+        if pdfium is not None:
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(pdf_path)
+                try:
+                    for page_idx in range(start, end):
+                        page = pdf[page_idx]
+                        textpage = page.get_textpage()
+                        text = textpage.get_text_range()
+                        textpage.close()
+                        page.close()
+
+                        self._append_page(pages, text, page_idx, pdf_path, total_pages)
+                finally:
+                    pdf.close()
+        else:
             with open(pdf_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    text = page.extract_text()
-                    
-                    # Clean up the extracted text
-                    text = self._clean_text(text)
-                    
-                    if text.strip():  # Only add pages with actual content
-                        pages.append({
-                            'text': text,
-                            'page_number': page_num,
-                            'source_file': pdf_path.name,
-                            'total_pages': len(pdf_reader.pages)
-                        })
-                        
+
+                # Bind the page list once; PyPDF2's .pages accessor walks
+                # the page tree and is not free on every access
+                pdf_pages = pdf_reader.pages
+
+                for page_idx in range(start, end):
+                    text = pdf_pages[page_idx].extract_text()
+                    self._append_page(pages, text, page_idx, pdf_path, total_pages)
+
+        return pages
+
+    def _append_page(self, pages: List[Dict[str, Any]], text: str, page_idx: int,
+                     pdf_path: Path, total_pages: int):
+        """Clean a page's raw text and append it if it has content."""
+        # Clean up the extracted text
+        text = self._clean_text(text)
+
+        if text.strip():  # Only add pages with actual content
+            pages.append({
+                'text': text,
+                'page_number': page_idx + 1,
+                'source_file': pdf_path.name,
+                'total_pages': total_pages
+            })
+
+    def _page_count(self, pdf_path: Path) -> int:
+        """Return the number of pages in a PDF without extracting text."""
+        if pdfium is not None:
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(pdf_path)
+                try:
+                    return len(pdf)
+                finally:
+                    pdf.close()
+
+        with open(pdf_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+
+    def extract_text_from_pdf(self, pdf_path: Path) -> List[Dict[str, Any]]:
+        """
+        Extract text from a PDF file page by page.
+
+        With pdfium the document is read in a single pass: PDFium is not
+        thread-safe, and its extraction is fast enough that threads would
+        only contend on _PDFIUM_LOCK. On the PyPDF2 fallback, long
+        documents are split into page ranges extracted by worker threads
+        in parallel; short ones are read in a single pass.
+
+        Args:
+            pdf_path: Path to the PDF file
+
+        Returns:
+            List of dictionaries containing page text and metadata,
+            ordered by page number
+        """
+        try:
+            total_pages = self._page_count(pdf_path)
         except Exception as e:
             print(f"Error processing {pdf_path}: {str(e)}")
-            
-        return pages
+            return []
+
+        workers = min(os.cpu_count() or 1, 4)
+
+        try:
+            if pdfium is not None or total_pages < 8 or workers < 2:
+                return self._extract_page_range(pdf_path, 0, total_pages, total_pages)
+
+            # Split pages into one contiguous range per worker so each
+            # reader is opened once, not once per page
+            step = -(-total_pages // workers)  # ceil division
+            ranges = [
+                (start, min(start + step, total_pages))
+                for start in range(0, total_pages, step)
+            ]
+
+            pages = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(self._extract_page_range, pdf_path, start, end, total_pages)
+                    for start, end in ranges
+                ]
+                for future in as_completed(futures):
+                    pages.extend(future.result())
+
+            # as_completed loses ordering; restore natural page order
+            pages.sort(key=lambda page: page['page_number'])
+            return pages
+
+        except Exception as e:
+            print(f"Error processing {pdf_path}: {str(e)}")
+            return []
     
     def _clean_text(self, text: str) -> str:
         """
@@ -75,11 +221,8 @@ class PDFProcessor:
         Returns:
             Cleaned text
         """
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove special characters that might interfere
-        text = re.sub(r'[^\w\s\.\,\!\?\:\;\-\(\)\[\]\'\"\/]', '', text)
+        # Collapse whitespace and strip special characters in one pass
+        text = _CLEAN_RE.sub(' ', text)
         
         # Strip leading/trailing whitespace
         text = text.strip()
@@ -98,23 +241,36 @@ class PDFProcessor:
             List of text chunks with metadata
         """
         chunks = []
-        
+
         # Simple word-based chunking
         words = text.split()
-        
-        for i in range(0, len(words), self.chunk_size - self.chunk_overlap):
-            chunk_words = words[i:i + self.chunk_size]
-            chunk_text = ' '.join(chunk_words)
-            
-            if chunk_text.strip():
-                chunk_metadata = metadata.copy()
-                chunk_metadata.update({
-                    'chunk_index': len(chunks),
-                    'text': chunk_text,
-                    'word_count': len(chunk_words)
-                })
-                chunks.append(chunk_metadata)
-                
+
+        if not words:
+            return chunks
+
+        # Slice chunks out of one normalized string via precomputed word-end
+        # offsets instead of re-joining the overlapping word lists per chunk,
+        # keeping chunking O(total words)
+        normalized = ' '.join(words)
+        # word_ends[k] = index just past word k in `normalized`, plus the
+        # trailing space
+        word_ends = list(itertools.accumulate(len(word) + 1 for word in words))
+
+        stride = self.chunk_size - self.chunk_overlap
+
+        for i in range(0, len(words), stride):
+            j = min(i + self.chunk_size, len(words))
+            start = word_ends[i - 1] if i > 0 else 0
+            chunk_text = normalized[start:word_ends[j - 1] - 1]
+
+            # Single C-level dict build instead of copy() + update() per chunk
+            chunks.append({
+                **metadata,
+                'chunk_index': len(chunks),
+                'text': chunk_text,
+                'word_count': j - i
+            })
+
         return chunks
     
     def create_document_links(self, filename: str) -> str:
@@ -134,46 +290,93 @@ class PDFProcessor:
         # For development - you can replace this with actual document URLs
         return f"file:///{self.pdf_directory.absolute()}/{filename}"
     
-    def process_all_pdfs(self) -> List[Dict[str, Any]]:
+    def process_pdf(self, pdf_file: Path) -> List[Dict[str, Any]]:
         """
-        Process all PDF files in the directory.
-        
+        Process a single PDF file into text chunks with metadata.
+
+        Args:
+            pdf_file: Path to the PDF file
+
         Returns:
-            List of all document chunks with metadata
+            List of document chunks for this file
+        """
+        print(f"Processing: {pdf_file.name}")
+
+        file_chunks = []
+
+        # Extract pages from PDF
+        pages = self.extract_text_from_pdf(pdf_file)
+
+        # Create document link and title once per file, not per page
+        doc_link = self.create_document_links(pdf_file.name)
+        doc_title = self._format_title(pdf_file.name)
+
+        # Process each page
+        for page_data in pages:
+            # Add document link and title to metadata
+            page_data['document_link'] = doc_link
+            page_data['document_title'] = doc_title
+
+            # Chunk the page text
+            chunks = self.chunk_text(page_data['text'], page_data)
+            file_chunks.extend(chunks)
+
+        return file_chunks
+
+    def iter_all_pdfs(self):
+        """
+        Process all PDF files in the directory, yielding chunks lazily.
+
+        One PDF's worth of chunks is in flight at a time on the consumer
+        side, so callers can stream chunks to disk or a vector store
+        without holding the whole corpus in memory.
+
+        Yields:
+            Document chunk dicts with metadata
         """
-        all_chunks = []
-        
         if not self.pdf_directory.exists():
             raise FileNotFoundError(f"PDF directory not found: {self.pdf_directory}")
-        
+
         pdf_files = list(self.pdf_directory.glob("*.pdf"))
-        
+
         if not pdf_files:
             print(f"No PDF files found in {self.pdf_directory}")
-            return []
-        
+            return
+
         print(f"Processing {len(pdf_files)} PDF files...")
-        
-        for pdf_file in pdf_files:
-            print(f"Processing: {pdf_file.name}")
-            
-            # Extract pages from PDF
-            pages = self.extract_text_from_pdf(pdf_file)
-            
-            # Create document link
-            doc_link = self.create_document_links(pdf_file.name)
-            
-            # Process each page
-            for page_data in pages:
-                # Add document link to metadata
-                page_data['document_link'] = doc_link
-                page_data['document_title'] = self._format_title(pdf_file.name)
-                
-                # Chunk the page text
-                chunks = self.chunk_text(page_data['text'], page_data)
-                all_chunks.extend(chunks)
-        
-        print(f"Created {len(all_chunks)} total chunks from {len(pdf_files)} documents")
+
+        # Parse PDFs in parallel worker processes; cap workers to keep
+        # PyPDF2 memory usage bounded
+        max_workers = min(os.cpu_count() or 1, 4, len(pdf_files))
+
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        _process_pdf_worker,
+                        pdf_file,
+                        str(self.pdf_directory),
+                        self.chunk_size,
+                        self.chunk_overlap
+                    )
+                    for pdf_file in pdf_files
+                ]
+                for future in as_completed(futures):
+                    yield from future.result()
+        else:
+            for pdf_file in pdf_files:
+                yield from self.process_pdf(pdf_file)
+
+    def process_all_pdfs(self) -> List[Dict[str, Any]]:
+        """
+        Process all PDF files in the directory.
+
+        Returns:
+            List of all document chunks with metadata
+        """
+        all_chunks = list(self.iter_all_pdfs())
+
+        print(f"Created {len(all_chunks)} total chunks")
         return all_chunks
     
     def _format_title(self, filename: str) -> str:
@@ -188,23 +391,58 @@ class PDFProcessor:
         """
         # Remove .pdf extension and replace special characters
         title = filename.replace('.pdf', '')
-        title = re.sub(r'[_\-\.]', ' ', title)
+        title = _TITLE_RE.sub(' ', title)
         title = ' '.join(word.capitalize() for word in title.split())
         return title
     
-    def save_chunks_to_json(self, chunks: List[Dict[str, Any]], output_path: str):
+    def save_chunks_to_json(self, chunks: List[Dict[str, Any]], output_path: str,
+                            indent: bool = False):
         """
         Save processed chunks to JSON file for inspection/debugging.
-        
+
         Args:
             chunks: List of document chunks
             output_path: Path to save JSON file
+            indent: Pretty-print the output (larger and slower; debug only)
         """
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(chunks, f, indent=2, ensure_ascii=False)
-        
+        # orjson serializes to bytes in one shot, several times faster than
+        # stdlib json on chunk files with thousands of objects
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(chunks, option=orjson.OPT_INDENT_2 if indent else 0))
+
         print(f"Saved {len(chunks)} chunks to {output_path}")
 
+    def save_chunks_stream(self, output_path: str) -> Dict[str, int]:
+        """
+        Process all PDFs and stream the chunks straight to a JSON file.
+
+        Unlike process_all_pdfs + save_chunks_to_json, this never holds the
+        full chunk list in memory: each chunk is serialized and written as
+        it is produced.
+
+        Args:
+            output_path: Path to save JSON file
+
+        Returns:
+            Mapping of source file name to number of chunks written
+        """
+        count = 0
+        source_counts: Dict[str, int] = {}
+
+        with open(output_path, 'wb') as f:
+            f.write(b'[')
+            for chunk in self.iter_all_pdfs():
+                if count:
+                    f.write(b',')
+                f.write(orjson.dumps(chunk))
+                count += 1
+                source = chunk['source_file']
+                source_counts[source] = source_counts.get(source, 0) + 1
+            f.write(b']')
+
+        print(f"Saved {count} chunks to {output_path}")
+        return source_counts
+
 
 def main():
     """Main function to test PDF processing."""
@@ -222,24 +460,20 @@ def main():
     )
     
     try:
-        # Process all PDFs
-        chunks = processor.process_all_pdfs()
-        
-        # Save for inspection
+        # Process all PDFs, streaming chunks straight to disk so the full
+        # corpus never sits in memory at once
         output_path = 'processed_chunks.json'
-        processor.save_chunks_to_json(chunks, output_path)
-        
+        source_counts = processor.save_chunks_stream(output_path)
+
         # Print summary
         print(f"\n📊 Processing Summary:")
-        print(f"Total chunks: {len(chunks)}")
-        
-        if chunks:
-            sources = set(chunk['source_file'] for chunk in chunks)
-            print(f"Source documents: {len(sources)}")
-            for source in sorted(sources):
-                source_chunks = [c for c in chunks if c['source_file'] == source]
-                print(f"  - {source}: {len(source_chunks)} chunks")
-        
+        print(f"Total chunks: {sum(source_counts.values())}")
+
+        if source_counts:
+            print(f"Source documents: {len(source_counts)}")
+            for source in sorted(source_counts):
+                print(f"  - {source}: {source_counts[source]} chunks")
+
     except Exception as e:
         print(f"Error processing PDFs: {str(e)}")
 
@@ -3,8 +3,12 @@ RAG (Retrieval-Augmented Generation) module for RAMate.
 Handles query processing, document retrieval, and response generation.
 """
 
+import asyncio
+import functools
+import hashlib
 import os
-import json
+import orjson
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
 import requests
 from dotenv import load_dotenv
@@ -12,9 +16,33 @@ from embed_and_store import EmbeddingManager
 
 load_dotenv()
 
+def _normalize_query(query: str) -> str:
+    """Canonical cache-key form of a query: lowercased, whitespace-collapsed."""
+    return ' '.join(query.lower().split())
+
 class RAGEngine:
     """Handles the complete RAG pipeline for RAMate."""
-    
+
+    # Static prompt scaffolding built once at class definition; per-query
+    # values are substituted with str.format in _create_prompt
+    _PROMPT_TEMPLATE = """You are RAMate, a helpful AI assistant for Resident Assistants (RAs) at Colorado State University. Your job is to provide clear, concise, and practical answers to help RAs do their job effectively.
+
+INSTRUCTIONS:
+- Give a direct, actionable answer in 2-3 paragraphs maximum
+- Focus on the most important and practical information
+- Use bullet points for procedures or lists when helpful
+- Always cite your sources at the end using format: (Source: Document Name, Page X)
+- Be conversational but professional
+- If the context doesn't fully answer the question, say what you know and suggest they contact their supervisor for additional details
+
+CONTEXT FROM RA TRAINING DOCUMENTS:
+{context}
+
+QUESTION: {query}
+
+ANSWER (Be concise and practical):"""
+
+
     def __init__(self, chroma_db_path: str = None):
         """
         Initialize RAG engine.
@@ -25,29 +53,101 @@ class RAGEngine:
         self.embedding_manager = EmbeddingManager(chroma_db_path)
         self.openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
         self.top_k = int(os.getenv('TOP_K_RESULTS', 5))
+
+        # Persistent session so each query reuses the TLS connection to
+        # OpenRouter instead of handshaking per call; retries cover
+        # transient 429/5xx responses
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Authorization": f"Bearer {self.openrouter_api_key}",
+            "Content-Type": "application/json"
+        })
+        # In-process caches keyed by normalized query: retrieval results via
+        # lru_cache, generated answers via a bounded insertion-ordered dict
+        # keyed on (query, context hash). Neither sees index changes on its
+        # own — clear_caches() must run after a rebuild.
+        self._retrieve_cached = functools.lru_cache(maxsize=256)(self._retrieve_uncached)
+        self._response_cache = OrderedDict()
+        self._response_cache_size = 256
+
+        retry = requests.adapters.Retry(
+            total=2,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"]
+        )
+        self._session.mount(
+            'https://',
+            requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        )
         
-    def retrieve_relevant_docs(self, query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+    def clear_caches(self):
+        """
+        Drop all in-process caches built on the current index contents.
+
+        Must be called after the vector store is rebuilt: the retrieval
+        lru_cache, the answer cache, and the embedding manager's
+        approximate query cache are all keyed on the query alone and
+        would otherwise keep serving results from deleted chunks.
+        """
+        self._retrieve_cached.cache_clear()
+        self._response_cache.clear()
+        self.embedding_manager._query_cache_clear()
+        # Drop the incrementally-tracked source set too; rebuilds can go
+        # through a different manager instance, so reseed lazily from the
+        # collection on the next stats call
+        self.embedding_manager._sources = None
+
+    def retrieve_relevant_docs(self, query: str, top_k: Optional[int] = None,
+                               query_norm: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents for a given query.
-        
+
         Args:
             query: User query
             top_k: Number of documents to retrieve
-            
+            query_norm: Pre-normalized query, if the caller already computed it
+
         Returns:
             List of relevant documents with metadata
         """
         k = top_k or min(3, self.top_k)  # Use top 3 for more focused responses
-        
+
+        # Cached on the normalized query so reloads and trivial rephrasings
+        # skip the embedding + search round trip
+        if query_norm is None:
+            query_norm = _normalize_query(query)
+        return self._retrieve_cached(query_norm, k)
+
+    def _retrieve_uncached(self, query_norm: str, top_k: int) -> List[Dict[str, Any]]:
+        """Run the actual similarity search for a normalized query."""
         # Always use local embeddings for consistency
-        results = self.embedding_manager.search_similar(
-            query=query,
-            top_k=k,
+        return self.embedding_manager.search_similar(
+            query=query_norm,
+            top_k=top_k,
             use_openrouter=False  # Use local embeddings for both storage and retrieval
         )
-        
-        return results
     
+    def retrieve_relevant_docs_batch(self, queries: List[str],
+                                     top_k: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve relevant documents for several queries in one batch.
+
+        Args:
+            queries: User queries
+            top_k: Number of documents to retrieve per query
+
+        Returns:
+            One result list per query, in input order
+        """
+        k = top_k or min(3, self.top_k)
+
+        return self.embedding_manager.search_similar_batch(
+            queries=queries,
+            top_k=k,
+            use_openrouter=False
+        )
+
     def format_context(self, retrieved_docs: List[Dict[str, Any]]) -> str:
         """
         Format retrieved documents into context for the LLM.
@@ -75,121 +175,255 @@ Content: {doc['text'].strip()}"""
         
         return "\n\n".join(context_parts)
     
-    def generate_response(self, query: str, context: str) -> str:
+    def generate_response(self, query: str, context: str,
+                          retrieved_docs: List[Dict[str, Any]],
+                          query_norm: Optional[str] = None) -> str:
         """
         Generate response using OpenRouter API.
-        
+
         Args:
             query: User query
             context: Retrieved document context
-            
+            retrieved_docs: Structured retrieval results, used for the
+                fallback response when the API is unavailable
+            query_norm: Pre-normalized query, if the caller already computed it
+
         Returns:
             Generated response
         """
         if not self.openrouter_api_key:
-            return self._generate_fallback_response(query, context)
-        
+            return self._generate_fallback_response(query, retrieved_docs)
+
+        cache_key = self._response_cache_key(query_norm or _normalize_query(query), context)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         prompt = self._create_prompt(query, context)
-        
+
         try:
-            response = requests.post(
+            response = self._session.post(
                 "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.openrouter_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "deepseek/deepseek-chat-v3-0324:free",  # Free DeepSeek model
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are RAMate, a helpful AI assistant for Resident Assistants (RAs) at Colorado State University. You help RAs find information from their training documents."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "max_tokens": 1000,
-                    "temperature": 0.3
-                }
+                data=orjson.dumps(self._completion_payload(prompt)),
+                timeout=30
             )
-            
+
             if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
+                result = orjson.loads(response.content)
+                answer = result['choices'][0]['message']['content']
+                self._response_cache_store(cache_key, answer)
+                return answer
             else:
                 print(f"OpenRouter API error: {response.status_code} - {response.text}")
-                return self._generate_fallback_response(query, context)
-                
+                return self._generate_fallback_response(query, retrieved_docs)
+
         except Exception as e:
             print(f"Error calling OpenRouter API: {str(e)}")
-            return self._generate_fallback_response(query, context)
+            return self._generate_fallback_response(query, retrieved_docs)
     
-    def _create_prompt(self, query: str, context: str) -> str:
+    def generate_response_stream(self, query: str, context: str,
+                                 retrieved_docs: List[Dict[str, Any]],
+                                 query_norm: Optional[str] = None):
         """
-        Create a prompt for the LLM with retrieved context.
-        
+        Stream the OpenRouter response as it is generated.
+
+        Uses the SSE streaming API ("stream": true) so the first tokens
+        reach the caller in a few hundred milliseconds instead of after
+        the full completion. Falls back to yielding a single complete
+        response when the API is unavailable or the answer is cached.
+
         Args:
             query: User query
             context: Retrieved document context
-            
+            retrieved_docs: Structured retrieval results for the fallback
+            query_norm: Pre-normalized query, if the caller already computed it
+
+        Yields:
+            Response text fragments in generation order
+        """
+        if not self.openrouter_api_key:
+            yield self._generate_fallback_response(query, retrieved_docs)
+            return
+
+        cache_key = self._response_cache_key(query_norm or _normalize_query(query), context)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        payload = self._completion_payload(self._create_prompt(query, context))
+        payload["stream"] = True
+
+        try:
+            response = self._session.post(
+                "https://openrouter.ai/api/v1/chat/completions",
+                data=orjson.dumps(payload),
+                timeout=30,
+                stream=True
+            )
+
+            if response.status_code != 200:
+                print(f"OpenRouter API error: {response.status_code} - {response.text}")
+                yield self._generate_fallback_response(query, retrieved_docs)
+                return
+
+            parts = []
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+
+                data = line[len("data: "):]
+                if data == "[DONE]":
+                    break
+
+                delta = orjson.loads(data)['choices'][0].get('delta', {})
+                token = delta.get('content')
+                if token:
+                    parts.append(token)
+                    yield token
+
+            if parts:
+                self._response_cache_store(cache_key, ''.join(parts))
+
+        except Exception as e:
+            print(f"Error streaming from OpenRouter API: {str(e)}")
+            yield self._generate_fallback_response(query, retrieved_docs)
+
+    @staticmethod
+    def _response_cache_key(query_norm: str, context: str) -> tuple:
+        """Cache key for a generated answer: normalized query + context hash."""
+        context_hash = hashlib.blake2b(context.encode('utf-8'), digest_size=16).hexdigest()
+        return (query_norm, context_hash)
+
+    def _response_cache_store(self, cache_key: tuple, answer: str):
+        """Store a generated answer, evicting the oldest entry when full."""
+        self._response_cache[cache_key] = answer
+        if len(self._response_cache) > self._response_cache_size:
+            self._response_cache.popitem(last=False)
+
+    @staticmethod
+    def _completion_payload(prompt: str) -> Dict[str, Any]:
+        """Request payload for the OpenRouter chat completions endpoint."""
+        return {
+            "model": "deepseek/deepseek-chat-v3-0324:free",  # Free DeepSeek model
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are RAMate, a helpful AI assistant for Resident Assistants (RAs) at Colorado State University. You help RAs find information from their training documents."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": 1000,
+            "temperature": 0.3
+        }
+
+    async def generate_response_async(self, query: str, context: str,
+                                      retrieved_docs: List[Dict[str, Any]],
+                                      query_norm: Optional[str] = None) -> str:
+        """
+        Async variant of generate_response using aiohttp, so several
+        in-flight queries can overlap their OpenRouter round-trips.
+
+        Args:
+            query: User query
+            context: Retrieved document context
+            retrieved_docs: Structured retrieval results for the fallback
+            query_norm: Pre-normalized query, if the caller already computed it
+
         Returns:
-            Formatted prompt
+            Generated response
         """
-        prompt = f"""You are RAMate, a helpful AI assistant for Resident Assistants (RAs) at Colorado State University. Your job is to provide clear, concise, and practical answers to help RAs do their job effectively.
+        if not self.openrouter_api_key:
+            return self._generate_fallback_response(query, retrieved_docs)
 
-INSTRUCTIONS:
-- Give a direct, actionable answer in 2-3 paragraphs maximum
-- Focus on the most important and practical information
-- Use bullet points for procedures or lists when helpful
-- Always cite your sources at the end using format: (Source: Document Name, Page X)
-- Be conversational but professional
-- If the context doesn't fully answer the question, say what you know and suggest they contact their supervisor for additional details
+        if query_norm is None:
+            query_norm = _normalize_query(query)
+        cache_key = self._response_cache_key(query_norm, context)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-CONTEXT FROM RA TRAINING DOCUMENTS:
-{context}
+        try:
+            import aiohttp
+        except ImportError:
+            print("aiohttp not available, using synchronous request")
+            return self.generate_response(query, context, retrieved_docs, query_norm)
 
-QUESTION: {query}
+        prompt = self._create_prompt(query, context)
 
-ANSWER (Be concise and practical):"""
-        
-        return prompt
-    
-    def _generate_fallback_response(self, query: str, context: str) -> str:
+        try:
+            async with aiohttp.ClientSession(
+                headers={
+                    "Authorization": f"Bearer {self.openrouter_api_key}",
+                    "Content-Type": "application/json"
+                },
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as session:
+                async with session.post(
+                    "https://openrouter.ai/api/v1/chat/completions",
+                    data=orjson.dumps(self._completion_payload(prompt))
+                ) as response:
+                    if response.status == 200:
+                        result = orjson.loads(await response.read())
+                        answer = result['choices'][0]['message']['content']
+                        self._response_cache_store(cache_key, answer)
+                        return answer
+
+                    body = await response.text()
+                    print(f"OpenRouter API error: {response.status} - {body}")
+                    return self._generate_fallback_response(query, retrieved_docs)
+
+        except Exception as e:
+            print(f"Error calling OpenRouter API: {str(e)}")
+            return self._generate_fallback_response(query, retrieved_docs)
+
+    def _create_prompt(self, query: str, context: str) -> str:
         """
-        Generate a fallback response when API is not available.
+        Create a prompt for the LLM with retrieved context.
         
         Args:
             query: User query
             context: Retrieved document context
             
+        Returns:
+            Formatted prompt
+        """
+        return self._PROMPT_TEMPLATE.format(context=context, query=query)
+    
+    def _generate_fallback_response(self, query: str,
+                                    retrieved_docs: List[Dict[str, Any]]) -> str:
+        """
+        Generate a fallback response when API is not available.
+
+        Args:
+            query: User query
+            retrieved_docs: Structured retrieval results
+
         Returns:
             Fallback response
         """
-        if not context or context == "No relevant documents found.":
-            return """I apologize, but I couldn't find relevant information in the training documents to answer your question. 
+        if not retrieved_docs:
+            return """I apologize, but I couldn't find relevant information in the training documents to answer your question.
 
 Please try rephrasing your question or contact your supervisor for assistance.
 
 **RAMate** - *Your RA Assistant*"""
-        
-        # Extract key information from context for a structured response
+
+        # Build the structured response straight from the retrieval results
+        # rather than re-parsing the formatted context string
         sources = []
         content_summaries = []
-        
-        # Parse the context to extract structured information
-        sections = context.split('[Source ')
-        for section in sections[1:]:  # Skip empty first section
-            lines = section.strip().split('\n')
-            if len(lines) >= 3:
-                doc_info = lines[1].replace('Document: ', '').strip()
-                page_info = lines[2].replace('Page: ', '').strip()
-                content = '\n'.join(lines[3:]).replace('Content: ', '').strip()
-                
-                sources.append(f"{doc_info} (Page {page_info})")
-                # Take first 200 characters of content for summary
-                content_summaries.append(content[:200] + '...' if len(content) > 200 else content)
+
+        for doc in retrieved_docs:
+            metadata = doc['metadata']
+            sources.append(f"{metadata['document_title']} (Page {metadata['page_number']})")
+
+            # Take first 200 characters of content for summary
+            content = doc['text'].strip()
+            content_summaries.append(content[:200] + '...' if len(content) > 200 else content)
         
         # Create a structured response
         response = f"""**Regarding: {query}**
@@ -221,48 +455,145 @@ Based on the RA training documents, here's what I found:
             Dictionary containing answer and metadata
         """
         print(f"Processing query: {query}")
-        
+
+        # Normalize once at the pipeline entry; retrieval and the answer
+        # cache key both on this form, while the original query is kept
+        # for the LLM prompt and the user-facing echo.
+        query_norm = _normalize_query(query)
+
         # Step 1: Retrieve relevant documents
-        retrieved_docs = self.retrieve_relevant_docs(query)
-        
+        retrieved_docs = self.retrieve_relevant_docs(query, query_norm=query_norm)
+
+        return self._answer_from_docs(query, retrieved_docs, query_norm)
+
+    def _answer_from_docs(self, query: str,
+                          retrieved_docs: List[Dict[str, Any]],
+                          query_norm: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Generate an answer from already-retrieved documents.
+
+        Split out of answer_question so batched callers can retrieve for
+        many queries at once and feed the results through here.
+
+        Args:
+            query: User question
+            retrieved_docs: Retrieval results for this query
+            query_norm: Pre-normalized query, if the caller already computed it
+
+        Returns:
+            Dictionary containing answer and metadata
+        """
         if not retrieved_docs:
-            return {
-                'answer': "I couldn't find relevant information in the training documents for your query. Please try rephrasing your question or contact your supervisor.",
-                'sources': [],
-                'links': [],
-                'confidence': 0.0
-            }
-        
+            return self._no_context_result()
+
         # Step 2: Format context
         context = self.format_context(retrieved_docs)
-        
+
         # Step 3: Generate response
-        answer = self.generate_response(query, context)
-        
-        # Step 4: Extract metadata for frontend
-        sources = []
-        links = []
-        
+        answer = self.generate_response(query, context, retrieved_docs, query_norm)
+
+        # Step 4: Package answer with metadata for the frontend
+        return self._build_result(answer, retrieved_docs)
+
+    def answer_question_stream(self, query: str):
+        """
+        Streaming RAG pipeline: retrieve documents, then yield the answer
+        as text fragments while the LLM generates it.
+
+        Args:
+            query: User question
+
+        Yields:
+            Answer text fragments in generation order
+        """
+        print(f"Processing query (streaming): {query}")
+
+        query_norm = _normalize_query(query)
+        retrieved_docs = self.retrieve_relevant_docs(query, query_norm=query_norm)
+
+        if not retrieved_docs:
+            yield self._no_context_result()['answer']
+            return
+
+        context = self.format_context(retrieved_docs)
+        yield from self.generate_response_stream(query, context, retrieved_docs, query_norm)
+
+    async def _answer_from_docs_async(self, query: str,
+                                      retrieved_docs: List[Dict[str, Any]],
+                                      query_norm: Optional[str] = None) -> Dict[str, Any]:
+        """Async counterpart of _answer_from_docs using generate_response_async."""
+        if not retrieved_docs:
+            return self._no_context_result()
+
+        context = self.format_context(retrieved_docs)
+        answer = await self.generate_response_async(query, context, retrieved_docs, query_norm)
+
+        return self._build_result(answer, retrieved_docs)
+
+    async def answer_question_async(self, query: str) -> Dict[str, Any]:
+        """
+        Async RAG pipeline: retrieval stays synchronous (in-process), but
+        the LLM call awaits on aiohttp so independent queries can overlap
+        their network round-trips via asyncio.gather.
+
+        Args:
+            query: User question
+
+        Returns:
+            Dictionary containing answer and metadata
+        """
+        print(f"Processing query: {query}")
+
+        query_norm = _normalize_query(query)
+
+        retrieved_docs = self.retrieve_relevant_docs(query, query_norm=query_norm)
+
+        return await self._answer_from_docs_async(query, retrieved_docs, query_norm)
+
+    @staticmethod
+    def _no_context_result() -> Dict[str, Any]:
+        """Result returned when retrieval finds nothing relevant."""
+        return {
+            'answer': "I couldn't find relevant information in the training documents for your query. Please try rephrasing your question or contact your supervisor.",
+            'sources': [],
+            'links': [],
+            'confidence': 0.0,
+            'retrieved_docs_count': 0
+        }
+
+    @staticmethod
+    def _build_result(answer: str, retrieved_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Package an answer and its retrieval results for the frontend.
+
+        Args:
+            answer: Generated answer text
+            retrieved_docs: Retrieval results backing the answer
+
+        Returns:
+            Dictionary containing answer and metadata
+        """
+        # Extract metadata for frontend, deduplicating via dicts
+        # (insertion-ordered) instead of O(N^2) list membership checks
+        sources_seen = {}
+        links_seen = {}
+
         for doc in retrieved_docs:
             metadata = doc['metadata']
-            source_info = f"{metadata['document_title']} (Page {metadata['page_number']})"
-            if source_info not in sources:
-                sources.append(source_info)
-            
-            if metadata['document_link'] not in links:
-                links.append(metadata['document_link'])
-        
+            sources_seen.setdefault(f"{metadata['document_title']} (Page {metadata['page_number']})")
+            links_seen.setdefault(metadata['document_link'])
+
         # Calculate confidence based on similarity scores
         avg_similarity = sum(doc['similarity_score'] for doc in retrieved_docs) / len(retrieved_docs)
-        
+
         return {
             'answer': answer,
-            'sources': sources,
-            'links': links,
+            'sources': list(sources_seen),
+            'links': list(links_seen),
             'confidence': avg_similarity,
             'retrieved_docs_count': len(retrieved_docs)
         }
-    
+
     def get_system_status(self) -> Dict[str, Any]:
         """
         Get system status for health checks.
@@ -291,7 +622,7 @@ def main():
     # Check system status
     status = rag_engine.get_system_status()
     print("🔧 System Status:")
-    print(json.dumps(status, indent=2))
+    print(orjson.dumps(status, option=orjson.OPT_INDENT_2).decode())
     
     if status['vector_store_status'] == 'empty':
         print("\n❌ Vector store is empty. Please run embed_and_store.py first to process documents.")
@@ -307,14 +638,24 @@ def main():
     ]
     
     print(f"\n🤖 Testing RAG Engine with {len(test_queries)} queries...\n")
-    
-    for i, query in enumerate(test_queries, 1):
+
+    # Embed and retrieve for all test queries in one batch, then overlap
+    # the independent LLM round-trips with asyncio.gather
+    retrieved_per_query = rag_engine.retrieve_relevant_docs_batch(test_queries)
+
+    async def _answer_all():
+        return await asyncio.gather(*(
+            rag_engine._answer_from_docs_async(query, retrieved_docs)
+            for query, retrieved_docs in zip(test_queries, retrieved_per_query)
+        ))
+
+    results = asyncio.run(_answer_all())
+
+    for i, (query, result) in enumerate(zip(test_queries, results), 1):
         print(f"{'='*60}")
         print(f"Query {i}: {query}")
         print(f"{'='*60}")
-        
-        result = rag_engine.answer_question(query)
-        
+
         print(f"Answer:\n{result['answer']}\n")
         print(f"Sources: {result['sources']}")
         print(f"Confidence: {result['confidence']:.3f}")
@@ -0,0 +1,176 @@
+"""
+Semantic response cache for RAMate.
+Caches full chat responses in Redis keyed by an LSH bucket of the query
+embedding, so semantically similar queries can skip the whole RAG pipeline.
+"""
+
+import os
+
+import orjson
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class SemanticResponseCache:
+    """Redis-backed cache mapping query embeddings to chat results."""
+
+    def __init__(self, embedding_manager, embedding_dim: int = 384):
+        """
+        Initialize the semantic cache.
+
+        Args:
+            embedding_manager: EmbeddingManager used to embed queries
+            embedding_dim: Dimensionality of the query embeddings
+        """
+        self.embedding_manager = embedding_manager
+        self.ttl_seconds = int(os.getenv('SEMANTIC_CACHE_TTL', 900))
+        self.min_similarity = float(os.getenv('SEMANTIC_CACHE_MIN_SIMILARITY', 0.92))
+
+        # Cached values are the raw float32 embedding bytes followed by the
+        # orjson-encoded result, so lookups can check similarity with a
+        # zero-copy frombuffer and only JSON-decode the result on a hit
+        self._embedding_bytes = embedding_dim * 4
+
+        # Random-projection matrix for LSH bucketing: sign bits of R @ emb
+        # give a 64-bit bucket id. Seeded so buckets are stable across restarts.
+        self._projection = np.random.default_rng(0).standard_normal(
+            (embedding_dim, 64)
+        ).astype(np.float32)
+
+        self.redis = None
+        try:
+            import redis
+
+            self.redis = redis.Redis.from_url(
+                os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+                socket_connect_timeout=1
+            )
+            self.redis.ping()
+            print("Semantic cache connected to Redis")
+
+        except ImportError:
+            print("redis package not available, semantic cache disabled")
+        except Exception as e:
+            print(f"Redis not reachable, semantic cache disabled: {str(e)}")
+            self.redis = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the cache has a working Redis connection."""
+        return self.redis is not None
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed and L2-normalize a query for cache lookup/storage.
+
+        Args:
+            query: User query
+
+        Returns:
+            Normalized query embedding
+        """
+        embedding = np.asarray(
+            self.embedding_manager.generate_embeddings_local([query])[0],
+            dtype=np.float32
+        )
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding / norm
+        return embedding
+
+    def _signature(self, embedding: np.ndarray) -> int:
+        """Map an embedding to its 64-bit LSH bucket via projection signs."""
+        signs = (embedding @ self._projection) > 0
+        return int.from_bytes(np.packbits(signs).tobytes(), 'big')
+
+    def _bucket_key(self, bucket: int) -> str:
+        """Redis key for a bucket id."""
+        return f"ramate:resp:{bucket:016x}"
+
+    def get(self, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result for a query embedding.
+
+        The exact bucket plus all 64 one-bit-Hamming-neighbor buckets are
+        probed in a single MGET, so near-threshold queries that land just
+        across a projection hyperplane still hit. A bucket hit is only
+        returned if the stored query embedding is actually close
+        (cosine >= min_similarity), so unrelated queries that happen to
+        share a bucket never reuse each other's answers.
+
+        Args:
+            embedding: Normalized query embedding
+
+        Returns:
+            Cached result dict, or None on miss
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            bucket = self._signature(embedding)
+            keys = [self._bucket_key(bucket)]
+            keys.extend(self._bucket_key(bucket ^ (1 << bit)) for bit in range(64))
+
+            for payload in self.redis.mget(keys):
+                if payload is None or len(payload) <= self._embedding_bytes:
+                    continue
+
+                stored = np.frombuffer(payload[:self._embedding_bytes], dtype=np.float32)
+
+                if float(stored @ embedding) >= self.min_similarity:
+                    return orjson.loads(payload[self._embedding_bytes:])
+
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {str(e)}")
+
+        return None
+
+    def clear(self):
+        """
+        Delete all cached responses, e.g. after an index rebuild.
+
+        Cached entries hold fully-formed answers with sources and links,
+        so after the underlying collection changes they must go rather
+        than serve stale content until the TTL runs out.
+        """
+        if not self.enabled:
+            return
+
+        try:
+            batch = []
+            for key in self.redis.scan_iter(match="ramate:resp:*", count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    self.redis.delete(*batch)
+                    batch = []
+            if batch:
+                self.redis.delete(*batch)
+            print("Semantic cache cleared")
+
+        except Exception as e:
+            print(f"Semantic cache clear failed: {str(e)}")
+
+    def put(self, embedding: np.ndarray, result: Dict[str, Any]):
+        """
+        Store a chat result for a query embedding with the configured TTL.
+
+        Args:
+            embedding: Normalized query embedding
+            result: Result dict from the RAG pipeline
+        """
+        if not self.enabled:
+            return
+
+        try:
+            payload = embedding.astype(np.float32).tobytes() + orjson.dumps(result)
+            self.redis.setex(
+                self._bucket_key(self._signature(embedding)),
+                self.ttl_seconds,
+                payload
+            )
+        except Exception as e:
+            print(f"Semantic cache store failed: {str(e)}")